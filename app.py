@@ -1,8 +1,9 @@
+import threading
+
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
+from itertools import islice
 
 # Set page config
 st.set_page_config(
@@ -12,69 +13,214 @@ st.set_page_config(
 )
 
 # List of major ASX mining stocks with their tickers
-MINING_STOCKS = {
-    'BHP Group': 'BHP.AX',
-    'Rio Tinto': 'RIO.AX',
-    'Fortescue Metals': 'FMG.AX',
-    'Northern Star': 'NST.AX',
-    'Evolution Mining': 'EVN.AX',
-    'Mineral Resources': 'MIN.AX',
-    'South32': 'S32.AX',
-    'Newcrest Mining': 'NCM.AX',
-    'Pilbara Minerals': 'PLS.AX',
-    'Lynas Rare Earths': 'LYC.AX'
+MINING_STOCK_NAMES = (
+    'BHP Group',
+    'Rio Tinto',
+    'Fortescue Metals',
+    'Northern Star',
+    'Evolution Mining',
+    'Mineral Resources',
+    'South32',
+    'Newcrest Mining',
+    'Pilbara Minerals',
+    'Lynas Rare Earths'
+)
+MINING_STOCK_TICKERS = (
+    'BHP.AX',
+    'RIO.AX',
+    'FMG.AX',
+    'NST.AX',
+    'EVN.AX',
+    'MIN.AX',
+    'S32.AX',
+    'NCM.AX',
+    'PLS.AX',
+    'LYC.AX'
+)
+MINING_STOCKS = dict(zip(MINING_STOCK_NAMES, MINING_STOCK_TICKERS))
+
+# Yahoo caps the number of symbols served per request
+MAX_TICKERS_PER_REQUEST = 20
+# Upper bound on concurrent symbol fetches, to avoid Yahoo throttling
+MAX_DOWNLOAD_THREADS = 10
+
+# Data, partial-result and HTTP caches stack, so together they bound staleness
+# to 15 minutes; partial results are kept briefly so failed tickers are retried soon
+DATA_CACHE_TTL = 600
+PARTIAL_CACHE_TTL = 60
+HTTP_CACHE_TTL = 240
+
+# Only the OHLCV columns are charted or summarised; Adj Close is intentionally
+# dropped, re-add it if a feature needs adjusted prices
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+# float32 keeps ~7 significant digits, well beyond the 2dp displayed
+OHLCV_DTYPES = {
+    'Open': 'float32',
+    'High': 'float32',
+    'Low': 'float32',
+    'Close': 'float32',
+    'Volume': 'uint32'
 }
 
-def load_stock_data(ticker, period='1y'):
-    """Load stock data using yfinance"""
-    try:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period=period)
-        if hist.empty:
-            st.warning(f"No data available for {ticker}")
-            return None
-        return hist
-    except Exception as e:
-        st.error(f"Error loading data for {ticker}: {str(e)}")
-        return None
+# Daily candles beyond this many points are resampled to weekly for charting
+MAX_CHART_POINTS = 500
+WEEKLY_OHLCV_AGG = {
+    'Open': 'first',
+    'High': 'max',
+    'Low': 'min',
+    'Close': 'last',
+    'Volume': 'sum'
+}
 
-def create_stock_chart(data, company_name):
+class StockDataError(Exception):
+    """Raised when some tickers failed to load, carrying the ones that did"""
+    
+    def __init__(self, all_data, errors, missing):
+        super().__init__(f"Failed to load {len(errors) + len(missing)} ticker(s)")
+        self.all_data = all_data
+        self.errors = errors
+        self.missing = missing
+
+@st.cache_resource
+def get_http_session():
+    """Shared HTTP session, persisted to SQLite so restarts start with a warm cache"""
+    from requests_cache import CachedSession
+    
+    # yfinance appends a session-specific crumb to every URL; keep it out of the cache key
+    return CachedSession('yf_cache',
+                         expire_after=HTTP_CACHE_TTL,
+                         ignored_parameters=['crumb'])
+
+@st.cache_resource
+def get_download_lock():
+    """Process-wide lock, as yf.download collects results in module-global state"""
+    return threading.Lock()
+
+@st.cache_data(ttl=DATA_CACHE_TTL, show_spinner=False)
+def load_all_stock_data(tickers, period='1y'):
+    """Load stock data for several tickers, caching only complete results
+    
+    Raises StockDataError if any ticker failed; the partial result behind it is
+    held for PARTIAL_CACHE_TTL so reruns do not re-download the healthy tickers.
+    """
+    all_data, errors, missing = _download_stock_data(tickers, period)
+    if errors or missing:
+        raise StockDataError(all_data, errors, missing)
+    return all_data
+
+@st.cache_data(ttl=PARTIAL_CACHE_TTL, show_spinner=False)
+def _download_stock_data(tickers, period):
+    """Download stock data using batched yfinance calls, recording failed tickers"""
+    # Imported lazily so reruns served from the cache never touch yfinance
+    import yfinance as yf
+    
+    all_data = {}
+    errors = {}
+    missing = []
+    tickers = iter(tickers)
+    while chunk := list(islice(tickers, MAX_TICKERS_PER_REQUEST)):
+        try:
+            # Sessions run in separate threads; concurrent downloads would clobber each other
+            with get_download_lock():
+                data = yf.download(tickers=chunk,
+                                   period=period,
+                                   group_by='ticker',
+                                   threads=min(MAX_DOWNLOAD_THREADS, len(chunk)),
+                                   progress=False,
+                                   auto_adjust=False,
+                                   session=get_http_session())
+        except Exception as e:
+            for ticker in chunk:
+                errors[ticker] = str(e)
+            continue
+        
+        for ticker in chunk:
+            # A single-ticker download comes back without the ticker column level
+            if len(chunk) == 1:
+                hist = data
+            elif ticker in data.columns.get_level_values(0):
+                hist = data[ticker]
+            else:
+                hist = None
+            
+            if hist is not None:
+                hist = hist[OHLCV_COLUMNS].dropna().astype(OHLCV_DTYPES)
+            if hist is None or hist.empty:
+                missing.append(ticker)
+            else:
+                # Period high/low are fixed per (ticker, period), so compute them once here
+                hist.attrs['high_52w'] = float(hist['High'].to_numpy().max())
+                hist.attrs['low_52w'] = float(hist['Low'].to_numpy().min())
+                all_data[ticker] = hist
+    return all_data, errors, missing
+
+def create_stock_chart(data, company_name, period):
     """Create a candlestick chart using plotly"""
     if data is None or data.empty:
         return None
-        
-    fig = go.Figure(data=[go.Candlestick(x=data.index,
-                                        open=data['Open'],
-                                        high=data['High'],
-                                        low=data['Low'],
-                                        close=data['Close'])])
+    
+    # Cheap fingerprint of the data so unchanged charts come from the cache
+    data_hash = (hash(data.index.values.tobytes())
+                 ^ hash(data[['Open', 'High', 'Low', 'Close']].to_numpy().tobytes()))
+    return _build_stock_chart(company_name, period, data_hash, data)
+
+@st.cache_resource(show_spinner=False, max_entries=100)
+def _build_stock_chart(company_name, period, data_hash, _data):
+    """Build the candlestick figure; the underscored frame is keyed by data_hash"""
+    # Imported lazily as plotly's graph_objects is slow to load on cold start
+    import plotly.graph_objects as go
+    
+    # Weeks end on Friday so each weekly candle is dated on a trading day
+    if len(_data) > MAX_CHART_POINTS:
+        _data = _data.resample('W-FRI').agg(WEEKLY_OHLCV_AGG).dropna()
+    
+    fig = go.Figure(data=[go.Candlestick(x=_data.index.strftime('%Y-%m-%d').to_numpy(),
+                                        open=_data['Open'].to_numpy(),
+                                        high=_data['High'].to_numpy(),
+                                        low=_data['Low'].to_numpy(),
+                                        close=_data['Close'].to_numpy())])
     
     fig.update_layout(
         title=f'{company_name} Stock Price',
         yaxis_title='Price (AUD)',
         xaxis_title='Date',
-        template='plotly_dark'
+        template='plotly_dark',
+        # Keep the user's zoom/pan state across reruns of the same view, but reset
+        # it when the period (and so the date range/candle size) changes
+        uirevision=f'{company_name}|{period}'
     )
     return fig
 
-def get_safe_value(data, column, index=-1, default="N/A"):
-    """Safely get value from DataFrame with fallback"""
-    if data is None or data.empty:
-        return default
-    try:
-        return data[column][index]
-    except:
-        return default
-
-def calculate_daily_change(data):
-    """Safely calculate daily change percentage"""
-    if data is None or data.empty or len(data) < 2:
-        return "N/A"
-    try:
-        change = ((data['Close'][-1] - data['Close'][-2]) / data['Close'][-2]) * 100
-        return f"{change:.2f}%"
-    except:
-        return "N/A"
+@st.fragment
+def render_ticker(company, data, period):
+    """Render one company's chart and metrics
+    
+    This is a fragment so that per-ticker controls added here rerun only this block;
+    it holds no widgets yet, so today it always reruns with the page.
+    """
+    # Create and display chart
+    fig = create_stock_chart(data, company, period)
+    if fig:
+        st.plotly_chart(fig, theme=None, use_container_width=True)
+    
+    # Pull the columns out as arrays once for the metrics row
+    close = data['Close'].to_numpy()
+    volume = data['Volume'].to_numpy()
+    
+    # Display key metrics
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Current Price", f"${close[-1]:.2f}")
+    with col2:
+        if len(close) < 2:
+            daily_change = "N/A"
+        else:
+            daily_change = f"{(close[-1] - close[-2]) / close[-2] * 100:.2f}%"
+        st.metric("Daily Change", daily_change)
+    with col3:
+        st.metric("Volume", f"{volume[-1]:,.0f}")
+    with col4:
+        st.metric("52W High", f"${data.attrs['high_52w']:.2f}")
 
 def main():
     st.title("ASX Mining Stocks Tracker")
@@ -84,8 +230,8 @@ def main():
     st.sidebar.header("Settings")
     selected_stocks = st.sidebar.multiselect(
         "Select Stocks to Track",
-        list(MINING_STOCKS.keys()),
-        default=list(MINING_STOCKS.keys())[:3]
+        MINING_STOCK_NAMES,
+        default=MINING_STOCK_NAMES[:3]
     )
     
     time_period = st.sidebar.selectbox(
@@ -96,78 +242,68 @@ def main():
     
     # Main content
     if selected_stocks:
+        # Tuple so the cache key is hashable
+        tickers = tuple(MINING_STOCKS[company] for company in selected_stocks)
+        try:
+            all_data = load_all_stock_data(tickers, time_period)
+        except StockDataError as e:
+            # Show what did load; the failed tickers are retried on the next rerun
+            all_data = e.all_data
+            for ticker, error in e.errors.items():
+                st.error(f"Error loading data for {ticker}: {error}")
+            for ticker in e.missing:
+                st.warning(f"No data available for {ticker}")
+        
+        # Resolve each company's data once so both tabs share it
+        stock_data = {
+            company: all_data[ticker]
+            for company, ticker in zip(selected_stocks, tickers)
+            if ticker in all_data
+        }
+        
         # Create tabs for different views
         tab1, tab2 = st.tabs(["Charts", "Summary"])
         
         with tab1:
             # Display charts
-            for company in selected_stocks:
-                ticker = MINING_STOCKS[company]
-                data = load_stock_data(ticker, time_period)
-                
-                if data is not None and not data.empty:
-                    # Create and display chart
-                    fig = create_stock_chart(data, company)
-                    if fig:
-                        st.plotly_chart(fig, use_container_width=True)
-                    
-                    # Display key metrics
-                    col1, col2, col3, col4 = st.columns(4)
-                    with col1:
-                        current_price = get_safe_value(data, 'Close')
-                        if current_price != "N/A":
-                            current_price = f"${current_price:.2f}"
-                        st.metric("Current Price", current_price)
-                    with col2:
-                        st.metric("Daily Change", calculate_daily_change(data))
-                    with col3:
-                        volume = get_safe_value(data, 'Volume')
-                        if volume != "N/A":
-                            volume = f"{volume:,.0f}"
-                        st.metric("Volume", volume)
-                    with col4:
-                        high = get_safe_value(data, 'High', default=0)
-                        if high != "N/A":
-                            high = f"${data['High'].max():.2f}"
-                        st.metric("52W High", high)
+            for company, data in stock_data.items():
+                render_ticker(company, data, time_period)
         
         with tab2:
-            # Create summary table
-            summary_data = []
-            for company in selected_stocks:
-                ticker = MINING_STOCKS[company]
-                data = load_stock_data(ticker, time_period)
-                
-                if data is not None:
-                    current_price = get_safe_value(data, 'Close')
-                    if current_price != "N/A":
-                        current_price = f"${current_price:.2f}"
-                    
-                    year_high = get_safe_value(data, 'High', default=0)
-                    if year_high != "N/A":
-                        year_high = f"${data['High'].max():.2f}"
-                    
-                    year_low = get_safe_value(data, 'Low', default=0)
-                    if year_low != "N/A":
-                        year_low = f"${data['Low'].min():.2f}"
-                    
-                    volume = get_safe_value(data, 'Volume')
-                    if volume != "N/A":
-                        volume = f"{volume:,.0f}"
-                    
-                    summary_data.append({
-                        'Company': company,
-                        'Ticker': ticker,
-                        'Current Price': current_price,
-                        'Daily Change %': calculate_daily_change(data),
-                        'Volume': volume,
-                        'Year High': year_high,
-                        'Year Low': year_low
-                    })
-            
-            if summary_data:
-                summary_df = pd.DataFrame(summary_data)
-                st.dataframe(summary_df, use_container_width=True)
+            # Create summary table with a single groupby over all tickers' closes and volumes
+            if stock_data:
+                combined = pd.concat(stock_data, names=['Company']).reset_index(level=0)
+                combined['Prev Close'] = combined.groupby('Company', sort=False)['Close'].shift()
+                summary_df = combined.groupby('Company', sort=False).agg(**{
+                    'Current Price': ('Close', 'last'),
+                    'Prev Close': ('Prev Close', 'last'),
+                    'Volume': ('Volume', 'last')
+                })
+                # Period high/low were precomputed by the loader
+                summary_df['Year High'] = pd.Series(
+                    {company: data.attrs['high_52w'] for company, data in stock_data.items()}
+                )
+                summary_df['Year Low'] = pd.Series(
+                    {company: data.attrs['low_52w'] for company, data in stock_data.items()}
+                )
+                summary_df.insert(0, 'Ticker', summary_df.index.map(MINING_STOCKS))
+                summary_df.insert(
+                    2,
+                    'Daily Change %',
+                    (summary_df['Current Price'] - summary_df['Prev Close'])
+                    / summary_df['Prev Close'] * 100
+                )
+                summary_df = summary_df.drop(columns='Prev Close').reset_index()
+                st.dataframe(
+                    summary_df.style.format({
+                        'Current Price': '${:.2f}',
+                        'Daily Change %': '{:.2f}%',
+                        'Volume': '{:,.0f}',
+                        'Year High': '${:.2f}',
+                        'Year Low': '${:.2f}'
+                    }, na_rep="N/A"),
+                    use_container_width=True
+                )
             else:
                 st.warning("No data available for the selected stocks")
 